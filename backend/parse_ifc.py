@@ -3,24 +3,34 @@ IFC Parser using IfcOpenShell — extracts all properties, quantities, hierarchy
 and writes them to Supabase Postgres.
 
 Usage:
-    python parse_ifc.py <path_to_ifc_file> [--model-name "My Building"]
+    python parse_ifc.py <path_to_ifc_file> [--model-name "My Building"] [--workers 4] [--verbose]
 
 Requires:
-    pip install ifcopenshell supabase python-dotenv
+    pip install ifcopenshell supabase psycopg2-binary orjson python-dotenv
 """
 
 import sys
 import os
+import io
+import re
 import json
+import logging
+import functools
 import time
 import uuid
+import multiprocessing
+import operator
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, fields
 from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger("ifc_parser")
+
 import ifcopenshell
-import ifcopenshell.util.element
 import ifcopenshell.util.placement
 
 try:
@@ -28,26 +38,38 @@ try:
     HAS_GEOM = True
 except ImportError:
     HAS_GEOM = False
-    print("[WARN] ifcopenshell.geom not available — geometry-based volume/area calculation disabled")
+    logger.warning("[WARN] ifcopenshell.geom not available — geometry-based volume/area calculation disabled")
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
+import psycopg2
+from postgrest.types import ReturningMethod
 from supabase import create_client, Client
 
 # ── Supabase client ─────────────────────────────────────────────
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+SUPABASE_DB_URL = os.getenv("SUPABASE_DB_URL")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    print("ERROR: Set SUPABASE_URL and SUPABASE_SERVICE_KEY in .env")
+if not SUPABASE_URL or not SUPABASE_KEY or not SUPABASE_DB_URL:
+    logger.error("ERROR: Set SUPABASE_URL, SUPABASE_SERVICE_KEY and SUPABASE_DB_URL in .env")
     sys.exit(1)
 
+# REST client is used for the small metadata tables (ifc_models, ifc_spatial_tree);
+# the bulk element load goes straight to Postgres via COPY. Writes ask for
+# `Prefer: return=minimal` since none of the returned rows are used.
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 # ── IFC type constants ──────────────────────────────────────────
 
-SPATIAL_TYPES = [
+SPATIAL_TYPES = {
     "IfcProject", "IfcSite", "IfcBuilding", "IfcBuildingStorey", "IfcSpace"
-]
+}
 
 # Quantity name patterns (case-insensitive matching)
 VOLUME_KEYS = {"netvolume", "grossvolume", "volume"}
@@ -62,33 +84,238 @@ CONCRETE_KEYS = {"concretestrength", "concreteclass", "concretegrade",
                  "classofconcrete", "strengthclass"}
 
 
+def key_pattern(key_set: set) -> re.Pattern:
+    """Compile a key set into one substring-matching alternation."""
+    return re.compile("|".join(map(re.escape, sorted(key_set))))
+
+
+CONCRETE_PATTERN = key_pattern(CONCRETE_KEYS)
+
+# Numeric quantity columns, in priority order, and the property keys that feed them
+QUANTITY_CATEGORIES = {
+    "volume": VOLUME_KEYS,
+    "area": AREA_KEYS,
+    "height": HEIGHT_KEYS,
+    "length": LENGTH_KEYS,
+    "width": WIDTH_KEYS,
+    "perimeter": PERIMETER_KEYS,
+    "weight": WEIGHT_KEYS,
+}
+
+# Exact normalized key -> category
+KEY_CATEGORY = {k: cat for cat, keys in QUANTITY_CATEGORIES.items() for k in keys}
+
+# Substring fallback, one pattern per category in priority order
+QUANTITY_PATTERNS = tuple((cat, key_pattern(keys)) for cat, keys in QUANTITY_CATEGORIES.items())
+
+KEY_STRIP = str.maketrans("", "", " _-")
+
+# Max length of ifc_elements.search_text
+SEARCH_TEXT_LIMIT = 10000
+
+
+@dataclass(slots=True)
+class ElementRow:
+    """One ifc_elements row; field order is the COPY column order."""
+    model_id: str
+    express_id: int
+    global_id: str
+    ifc_type: str
+    name: str
+    description: str
+    volume: float
+    area: float
+    height: float
+    length: float
+    width: float
+    perimeter: float
+    weight: float
+    floor_name: str
+    materials: list[str]
+    classifications: list[str]
+    concrete_class: str
+    property_sets: dict
+    quantity_sets: dict
+    search_text: str
+
+
+# ifc_elements columns in COPY order
+ELEMENT_COLUMNS = tuple(f.name for f in fields(ElementRow))
+element_values = operator.attrgetter(*ELEMENT_COLUMNS)
+
+# ifc_element_properties columns in COPY order: one narrow row per pset/qto value
+PROPERTY_COLUMNS = ("model_id", "express_id", "pset_name", "key", "value_text", "value_num")
+
+# Rows per COPY call (each batch is committed on its own)
+COPY_BATCH_SIZE = int(os.getenv("IFC_COPY_BATCH") or 10000)
+
+
+@functools.lru_cache(maxsize=4096)
 def normalize_key(name: str) -> str:
     """Normalize property name for matching."""
-    return name.lower().replace(" ", "").replace("_", "").replace("-", "")
+    return name.lower().translate(KEY_STRIP)
 
 
-def match_keys(name: str, key_set: set) -> bool:
+def match_keys(name: str, pattern: re.Pattern) -> bool:
+    return pattern.search(normalize_key(name)) is not None
+
+
+@functools.lru_cache(maxsize=4096)
+def key_categories(name: str) -> tuple[str, ...]:
+    """All QUANTITY_CATEGORIES a property name matches, in priority order."""
     nk = normalize_key(name)
-    return any(k in nk for k in key_set)
+    cat = KEY_CATEGORY.get(nk)
+    if cat is not None:
+        return (cat,)
+    return tuple(cat for cat, pattern in QUANTITY_PATTERNS if pattern.search(nk))
+
+
+# Exact types safe_value passes through unchanged (one set lookup on the hot path)
+JSON_SAFE_TYPES = frozenset({int, float, bool, str, type(None)})
 
 
 def safe_value(val) -> str | int | float | bool | None:
     """Convert IFC value to JSON-safe Python type."""
-    if val is None:
-        return None
-    if isinstance(val, (int, float, bool)):
+    if type(val) in JSON_SAFE_TYPES:
         return val
-    if isinstance(val, str):
+    if isinstance(val, (int, float, str)):
         return val
-    # IfcOpenShell entity reference
-    if hasattr(val, "is_a"):
-        return str(val)
+    # IfcOpenShell entity reference, tuples of values, ...
     return str(val)
 
 
+def property_value(prop):
+    """Read the raw value of an IfcProperty, mirroring ifcopenshell.util.element.get_psets."""
+    if prop.is_a("IfcPropertySingleValue"):
+        return prop.NominalValue.wrappedValue if prop.NominalValue else None
+    if prop.is_a("IfcPropertyEnumeratedValue"):
+        return [v.wrappedValue for v in prop.EnumerationValues or []]
+    if prop.is_a("IfcPropertyListValue"):
+        return [v.wrappedValue for v in prop.ListValues or []]
+    if prop.is_a("IfcPropertyBoundedValue"):
+        # SetPointValue only exists from IFC4 on
+        bounds = {}
+        for attr in ("LowerBoundValue", "UpperBoundValue", "SetPointValue"):
+            bound = getattr(prop, attr, None)
+            if bound is not None:
+                bounds[attr] = bound.wrappedValue
+        return bounds
+    if prop.is_a("IfcPropertyTableValue"):
+        return {
+            "DefiningValues": [v.wrappedValue for v in prop.DefiningValues or []],
+            "DefinedValues": [v.wrappedValue for v in prop.DefinedValues or []],
+        }
+    if prop.is_a("IfcPropertyReferenceValue"):
+        return prop.PropertyReference
+    if prop.is_a("IfcComplexProperty"):
+        return {p.Name: property_value(p) for p in prop.HasProperties or []}
+    return None
+
+
+def quantity_value(quantity):
+    """Read the value of an IfcPhysicalQuantity (complex quantities become nested dicts)."""
+    if quantity.is_a("IfcPhysicalComplexQuantity"):
+        return {q.Name: quantity_value(q) for q in quantity.HasQuantities or []}
+    # IfcQuantityLength/Area/Volume/Count/Weight/Time: value is attribute 3
+    return quantity[3]
+
+
+# ── COPY text format encoding ──────────────────────────────────
+
+# Backslash, tab, newline and carriage return are special in COPY ... (FORMAT text)
+COPY_ESCAPE = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def pg_array(items: list[str]) -> str:
+    """Encode a list of strings as a Postgres array literal: {"a","b"}."""
+    quoted = []
+    for item in items:
+        item = str(item).replace("\\", "\\\\").replace('"', '\\"')
+        quoted.append(f'"{item}"')
+    return "{" + ",".join(quoted) + "}"
+
+
+def dumps_json(val) -> str:
+    """Serialize a pset/qto dict for a jsonb column (orjson when available)."""
+    if HAS_ORJSON:
+        return orjson.dumps(val, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(val)
+
+
+def copy_field(val) -> str:
+    """Encode a single value for a COPY text-format row."""
+    if val is None:
+        return "\\N"
+    if isinstance(val, bool):
+        return "t" if val else "f"
+    if isinstance(val, (list, tuple)):
+        val = pg_array(val)
+    elif isinstance(val, dict):
+        val = dumps_json(val)
+    return str(val).translate(COPY_ESCAPE)
+
+
+def to_copy_line(row: ElementRow) -> str:
+    """Render an element row as one tab-separated COPY line."""
+    return "\t".join(map(copy_field, element_values(row))) + "\n"
+
+
+def to_property_lines(row: ElementRow) -> str:
+    """Render an element's psets and qsets as ifc_element_properties COPY lines."""
+    head = f"{copy_field(row.model_id)}\t{row.express_id}\t"
+    lines = []
+    for source in (row.property_sets, row.quantity_sets):
+        for pset_name, props in source.items():
+            prefix = head + copy_field(pset_name) + "\t"
+            for k, v in props.items():
+                if isinstance(v, bool):
+                    value_text, value_num = ("true" if v else "false"), None
+                elif isinstance(v, (int, float)):
+                    value_text, value_num = str(v), v
+                else:
+                    value_text, value_num = v, None
+                # key is NOT NULL; a nameless property would fail the whole batch
+                lines.append(f"{prefix}{copy_field(k or '')}\t{copy_field(value_text)}\t{copy_field(value_num)}\n")
+    return "".join(lines)
+
+
+def copy_rows(conn, table: str, columns: tuple[str, ...], stream):
+    """Stream COPY text-format rows into `table` (caller commits)."""
+    with conn.cursor() as cur:
+        cur.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT text)",
+            stream,
+        )
+
+
+class ChunkReader:
+    """Read-only file-like view over a list of COPY text chunks, without joining them."""
+
+    def __init__(self, chunks: list[str]):
+        self._chunks = iter(chunks)
+
+    def read(self, size: int = -1) -> str:
+        # copy_expert sends whatever read() returns and stops at the first empty
+        # result, so hand out whole chunks and skip empty ones
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return ""
+
+
+def copy_batch(conn, batch: tuple[list[str], list[str], int]) -> int:
+    """COPY one batch of element and property chunks and commit it; returns the row count."""
+    element_chunks, property_chunks, rows = batch
+    copy_rows(conn, "ifc_elements", ELEMENT_COLUMNS, ChunkReader(element_chunks))
+    copy_rows(conn, "ifc_element_properties", PROPERTY_COLUMNS, ChunkReader(property_chunks))
+    conn.commit()
+    return rows
+
+
 # ── Extract properties & quantities ─────────────────────────────
 
-def extract_element_data(element, model, storey_map: dict) -> dict:
+def extract_element_data(element, model_id: str, storey_map: dict, defined_by: dict,
+                         mat_map: dict, class_map: dict) -> ElementRow:
     """Extract all properties, quantities, and key params for a single element."""
     express_id = element.id()
     global_id = getattr(element, "GlobalId", "") or ""
@@ -96,144 +323,124 @@ def extract_element_data(element, model, storey_map: dict) -> dict:
     description = getattr(element, "Description", "") or ""
     ifc_type = element.is_a()
 
-    # Get ALL property sets
+    # Property sets and quantity sets from the pre-built IsDefinedBy index
     psets = {}
-    try:
-        all_psets = ifcopenshell.util.element.get_psets(element)
-        for pset_name, props in all_psets.items():
-            clean_props = {}
-            for k, v in props.items():
-                if k == "id":
-                    continue
-                clean_props[k] = safe_value(v)
-            psets[pset_name] = clean_props
-    except Exception as e:
-        print(f"  [WARN] Failed to get psets for #{express_id}: {e}")
-
-    # Get quantity sets separately
     qsets = {}
-    try:
-        all_qtos = ifcopenshell.util.element.get_psets(element, qtos_only=True)
-        for qto_name, quantities in all_qtos.items():
-            clean_q = {}
-            for k, v in quantities.items():
-                if k == "id":
-                    continue
-                clean_q[k] = safe_value(v)
-            qsets[qto_name] = clean_q
-    except Exception:
-        pass
+    for definition, is_quantity_set in defined_by.get(express_id, ()):
+        try:
+            if is_quantity_set:
+                clean_q = qsets.setdefault(definition.Name or "", {})
+                for q in definition.Quantities or []:
+                    clean_q[q.Name] = safe_value(quantity_value(q))
+            elif is_quantity_set is None:
+                # Pre-defined property sets (door/window lining and panel properties, ...)
+                # hold their values as attributes from index 4 on, as get_psets reads them
+                clean_props = psets.setdefault(definition.Name or "", {})
+                for i in range(4, len(definition)):
+                    if definition[i] is not None:
+                        clean_props[definition.attribute_name(i)] = safe_value(definition[i])
+            else:
+                clean_props = psets.setdefault(definition.Name or "", {})
+                for prop in definition.HasProperties or []:
+                    clean_props[prop.Name] = safe_value(property_value(prop))
+        except Exception as e:
+            logger.warning(f"  [WARN] Failed to read {definition.is_a()} for #{express_id}: {e}")
 
     # Extract key numeric values from psets + qsets
-    volume = 0.0
-    area = 0.0
-    height = 0.0
-    length = 0.0
-    width = 0.0
-    perimeter = 0.0
-    weight = 0.0
+    quantities = dict.fromkeys(QUANTITY_CATEGORIES, 0.0)
     concrete_class = ""
 
-    for source in [psets, qsets]:
-        for pset_name, props in source.items():
+    for source in (psets, qsets):
+        for props in source.values():
             for k, v in props.items():
                 if v is None:
                     continue
-                nk = normalize_key(k)
-                try:
-                    fv = float(v) if isinstance(v, (int, float)) else None
-                except (ValueError, TypeError):
-                    fv = None
-
-                if fv is not None and fv > 0:
-                    if not volume and match_keys(k, VOLUME_KEYS):
-                        volume = fv
-                    elif not area and match_keys(k, AREA_KEYS):
-                        area = fv
-                    elif not height and match_keys(k, HEIGHT_KEYS):
-                        height = fv
-                    elif not length and match_keys(k, LENGTH_KEYS):
-                        length = fv
-                    elif not width and match_keys(k, WIDTH_KEYS):
-                        width = fv
-                    elif not perimeter and match_keys(k, PERIMETER_KEYS):
-                        perimeter = fv
-                    elif not weight and match_keys(k, WEIGHT_KEYS):
-                        weight = fv
-
-                if not concrete_class and isinstance(v, str) and match_keys(k, CONCRETE_KEYS):
+
+                if isinstance(v, (int, float)) and v > 0:
+                    # First matching column that is still empty, as in the old if/elif cascade
+                    for cat in key_categories(k):
+                        if not quantities[cat]:
+                            quantities[cat] = float(v)
+                            break
+
+                if not concrete_class and isinstance(v, str) and match_keys(k, CONCRETE_PATTERN):
                     concrete_class = v
 
-    # Materials
+    # Materials (resolved once per material entity)
     materials = []
     try:
-        mat = ifcopenshell.util.element.get_material(element)
+        mat = mat_map.get(express_id)
         if mat:
-            if mat.is_a("IfcMaterial"):
-                materials.append(mat.Name or "")
-            elif mat.is_a("IfcMaterialLayerSetUsage") or mat.is_a("IfcMaterialLayerSet"):
-                layer_set = mat if mat.is_a("IfcMaterialLayerSet") else mat.ForLayerSet
-                if layer_set:
-                    for layer in layer_set.MaterialLayers:
-                        if layer.Material:
-                            materials.append(layer.Material.Name or "")
-            elif mat.is_a("IfcMaterialList"):
-                for m in mat.Materials:
-                    materials.append(m.Name or "")
-            elif mat.is_a("IfcMaterialConstituentSet"):
-                for c in mat.MaterialConstituents or []:
-                    if c.Material:
-                        materials.append(c.Material.Name or "")
+            materials = list(materials_for(mat.id()))
     except Exception:
         pass
 
     # Classifications
     classifications = []
     try:
-        for rel in getattr(element, "HasAssociations", []) or []:
-            if rel.is_a("IfcRelAssociatesClassification"):
-                ref = rel.RelatingClassification
-                if ref:
-                    code = getattr(ref, "ItemReference", None) or getattr(ref, "Identification", None) or ""
-                    cname = getattr(ref, "Name", "") or ""
-                    classifications.append(f"{code}: {cname}" if code else cname)
+        for ref in class_map.get(express_id, ()):
+            code = getattr(ref, "ItemReference", None) or getattr(ref, "Identification", None) or ""
+            cname = getattr(ref, "Name", "") or ""
+            classifications.append(f"{code}: {cname}" if code else cname)
     except Exception:
         pass
 
     # Floor / storey from pre-built map
     floor_name = storey_map.get(express_id, "")
 
-    # Build search text for full-text search
-    search_parts = [ifc_type, name, description, floor_name, concrete_class]
-    search_parts.extend(materials)
-    search_parts.extend(classifications)
-    for pset_name, props in psets.items():
-        search_parts.append(pset_name)
-        for k, v in props.items():
-            search_parts.append(f"{k}={v}")
-    search_text = " ".join(str(s) for s in search_parts if s)
-
-    return {
-        "express_id": express_id,
-        "global_id": global_id,
-        "ifc_type": ifc_type,
-        "name": name,
-        "description": description,
-        "volume": round(volume, 6),
-        "area": round(area, 6),
-        "height": round(height, 6),
-        "length": round(length, 6),
-        "width": round(width, 6),
-        "perimeter": round(perimeter, 6),
-        "weight": round(weight, 6),
-        "floor_name": floor_name,
-        "materials": [m for m in materials if m],
-        "classifications": [c for c in classifications if c],
-        "concrete_class": concrete_class,
-        "property_sets": psets,
-        "quantity_sets": qsets,
-        "search_text": search_text[:10000],  # Limit for safety
-    }
+    # Build search text for full-text search, stopping once the budget is used up
+    search = io.StringIO()
+    remaining = SEARCH_TEXT_LIMIT
+
+    def add(part):
+        nonlocal remaining
+        if remaining <= 0 or not part:
+            return
+        if remaining < SEARCH_TEXT_LIMIT:
+            search.write(" ")
+            remaining -= 1
+        part = str(part)[:remaining]
+        search.write(part)
+        remaining -= len(part)
+
+    for part in (ifc_type, name, description, floor_name, concrete_class):
+        add(part)
+    for part in materials:
+        add(part)
+    for part in classifications:
+        add(part)
+    for source in (psets, qsets):
+        for pset_name, props in source.items():
+            if remaining <= 0:
+                break
+            add(pset_name)
+            for k, v in props.items():
+                if remaining <= 0:
+                    break
+                add(f"{k}={v}")
+
+    return ElementRow(
+        model_id=model_id,
+        express_id=express_id,
+        global_id=global_id,
+        ifc_type=ifc_type,
+        name=name,
+        description=description,
+        volume=quantities["volume"],
+        area=quantities["area"],
+        height=quantities["height"],
+        length=quantities["length"],
+        width=quantities["width"],
+        perimeter=quantities["perimeter"],
+        weight=quantities["weight"],
+        floor_name=floor_name,
+        materials=materials,
+        classifications=[c for c in classifications if c],
+        concrete_class=concrete_class,
+        property_sets=psets,
+        quantity_sets=qsets,
+        search_text=search.getvalue(),
+    )
 
 
 # ── Build storey map ────────────────────────────────────────────
@@ -241,19 +448,143 @@ def extract_element_data(element, model, storey_map: dict) -> dict:
 def build_storey_map(model) -> dict[int, str]:
     """Map element express_id -> storey name via IfcRelContainedInSpatialStructure."""
     storey_map = {}
+    structure_names = {}
     try:
         for rel in model.by_type("IfcRelContainedInSpatialStructure"):
             structure = rel.RelatingStructure
             if not structure:
                 continue
-            storey_name = getattr(structure, "Name", "") or getattr(structure, "LongName", "") or ""
+            # A storey usually appears in many rels; resolve its name once
+            storey_name = structure_names.get(structure.id())
+            if storey_name is None:
+                info = structure.get_info(recursive=False)
+                storey_name = info.get("Name") or info.get("LongName") or ""
+                structure_names[structure.id()] = storey_name
             for element in rel.RelatedElements or []:
                 storey_map[element.id()] = storey_name
     except Exception as e:
-        print(f"[WARN] Failed to build storey map: {e}")
+        logger.warning(f"[WARN] Failed to build storey map: {e}")
     return storey_map
 
 
+# ── Build property index ────────────────────────────────────────
+
+def build_property_index(model) -> dict[int, list[tuple[object, bool | None]]]:
+    """Map element express_id -> (definition, is_quantity_set), type psets first, then occurrence.
+
+    is_quantity_set is None for pre-defined property sets, whose values are attributes.
+    """
+    defined_by = {}
+    classified = {}
+
+    def classify(definitions) -> list[tuple[object, bool | None]]:
+        # Each definition is classified once, however many elements share it
+        entries = []
+        for definition in definitions:
+            entry = classified.get(definition.id())
+            if entry is None:
+                if definition.is_a("IfcElementQuantity"):
+                    entry = (definition, True)
+                elif definition.is_a("IfcPropertySet"):
+                    entry = (definition, False)
+                elif definition.is_a("IfcPropertySetDefinition"):
+                    entry = (definition, None)
+                else:
+                    entry = ()
+                classified[definition.id()] = entry
+            if entry:
+                entries.append(entry)
+        return entries
+
+    try:
+        for rel in model.by_type("IfcRelDefinesByType"):
+            type_psets = classify(getattr(rel.RelatingType, "HasPropertySets", None) or ())
+            if not type_psets:
+                continue
+            for obj in rel.RelatedObjects or []:
+                defined_by.setdefault(obj.id(), []).extend(type_psets)
+
+        for rel in model.by_type("IfcRelDefinesByProperties"):
+            # Occurrence definitions come after type ones so their values win
+            definition = rel.RelatingPropertyDefinition
+            if not definition:
+                continue
+            # IFC4 allows an IfcPropertySetDefinitionSet (tuple of definitions)
+            definitions = classify(definition if isinstance(definition, tuple) else (definition,))
+            if not definitions:
+                continue
+            for obj in rel.RelatedObjects or []:
+                defined_by.setdefault(obj.id(), []).extend(definitions)
+    except Exception as e:
+        logger.warning(f"[WARN] Failed to build property index: {e}")
+    return defined_by
+
+
+# ── Build association index ─────────────────────────────────────
+
+def build_association_index(model) -> tuple[dict[int, object], dict[int, list]]:
+    """Map element express_id -> material and -> classification references."""
+    mat_map = {}
+    class_map = {}
+    try:
+        for rel in model.by_type("IfcRelAssociatesMaterial"):
+            mat = rel.RelatingMaterial
+            if not mat:
+                continue
+            for obj in rel.RelatedObjects or []:
+                mat_map[obj.id()] = mat
+
+        # Occurrences without their own material inherit it from their type
+        for rel in model.by_type("IfcRelDefinesByType"):
+            type_mat = mat_map.get(rel.RelatingType.id()) if rel.RelatingType else None
+            if not type_mat:
+                continue
+            for obj in rel.RelatedObjects or []:
+                mat_map.setdefault(obj.id(), type_mat)
+
+        for rel in model.by_type("IfcRelAssociatesClassification"):
+            ref = rel.RelatingClassification
+            if not ref:
+                continue
+            for obj in rel.RelatedObjects or []:
+                class_map.setdefault(obj.id(), []).append(ref)
+    except Exception as e:
+        logger.warning(f"[WARN] Failed to build association index: {e}")
+    return mat_map, class_map
+
+
+@functools.lru_cache(maxsize=None)
+def materials_for(mat_id: int) -> tuple[str, ...]:
+    """Material names of a material definition, walked once per shared definition."""
+    # Keyed by express id; init_extraction clears the cache when a new model is loaded
+    mat = _extraction["model"].by_id(mat_id)
+    materials = []
+    seen = set()
+    seen_add = seen.add
+
+    def add(material):
+        # Unique, non-empty names in first-seen order
+        name = material.Name if material else None
+        if name and name not in seen:
+            seen_add(name)
+            materials.append(name)
+
+    if mat.is_a("IfcMaterial"):
+        add(mat)
+    elif mat.is_a("IfcMaterialLayerSetUsage") or mat.is_a("IfcMaterialLayerSet"):
+        layer_set = mat if mat.is_a("IfcMaterialLayerSet") else mat.ForLayerSet
+        if layer_set:
+            for layer in layer_set.MaterialLayers:
+                add(layer.Material)
+    elif mat.is_a("IfcMaterialList"):
+        for m in mat.Materials:
+            add(m)
+    elif mat.is_a("IfcMaterialConstituentSet"):
+        for c in mat.MaterialConstituents or []:
+            add(c.Material)
+    return tuple(materials)
+
+
 # ── Build spatial hierarchy ─────────────────────────────────────
 
 def build_spatial_tree(model) -> list[dict]:
@@ -311,25 +642,98 @@ def build_spatial_tree(model) -> list[dict]:
     return nodes
 
 
+# ── Element extraction workers ──────────────────────────────────
+
+# Worker processes for element extraction
+PARSE_WORKERS = int(os.getenv("IFC_PARSE_WORKERS") or 0) or os.cpu_count() or 1
+# Elements per extraction task
+EXTRACT_CHUNK_SIZE = 500
+
+# Per-process extraction state, set by init_extraction
+_extraction = {}
+
+
+def init_extraction(model, model_id: str, storey_map: dict):
+    """Prepare this process to extract elements of `model`."""
+    mat_map, class_map = build_association_index(model)
+    materials_for.cache_clear()
+    _extraction.update(
+        model=model,
+        model_id=model_id,
+        storey_map=storey_map,
+        defined_by=build_property_index(model),
+        mat_map=mat_map,
+        class_map=class_map,
+    )
+
+
+def init_worker(file_path: str, model_id: str, storey_map: dict):
+    """ProcessPoolExecutor initializer: open the IFC file once per worker."""
+    # Forked workers inherit the parent's already-parsed model and indexes
+    if _extraction.get("model_id") != model_id:
+        init_extraction(ifcopenshell.open(file_path, should_stream=False), model_id, storey_map)
+
+
+def process_ids(express_ids: list[int]) -> tuple[str, str, int]:
+    """Extract a chunk of elements, returning element and property COPY lines and row count."""
+    model = _extraction["model"]
+    lines = []
+    property_lines = []
+    for express_id in express_ids:
+        element = model.by_id(express_id)
+        try:
+            row = extract_element_data(
+                element,
+                _extraction["model_id"],
+                _extraction["storey_map"],
+                _extraction["defined_by"],
+                _extraction["mat_map"],
+                _extraction["class_map"],
+            )
+            lines.append(to_copy_line(row))
+            property_lines.append(to_property_lines(row))
+        except Exception as e:
+            logger.warning(f"  [WARN] Failed to process #{express_id} ({element.is_a()}): {e}")
+    return "".join(lines), "".join(property_lines), len(lines)
+
+
+def map_bounded(pool, fn, items, window: int):
+    """Like pool.map, but keeps at most `window` tasks in flight to bound memory."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
 # ── Main parse function ─────────────────────────────────────────
 
-def parse_ifc_file(file_path: str, model_name: str = None):
+def parse_ifc_file(file_path: str, model_name: str = None, workers: int = None):
     """Parse an IFC file and write results to Supabase."""
     path = Path(file_path)
     if not path.exists():
-        print(f"ERROR: File not found: {file_path}")
+        logger.error(f"ERROR: File not found: {file_path}")
+        sys.exit(1)
+
+    workers = workers or PARSE_WORKERS
+    if workers < 1:
+        logger.error(f"ERROR: Worker count must be at least 1, got {workers}")
         sys.exit(1)
 
     file_size = path.stat().st_size
     if not model_name:
         model_name = path.stem
 
-    print(f"[IFC Parser] Opening {path.name} ({file_size / 1024 / 1024:.1f} MB)...")
+    logger.info(f"[IFC Parser] Opening {path.name} ({file_size / 1024 / 1024:.1f} MB)...")
     t0 = time.time()
 
-    model = ifcopenshell.open(str(path))
+    # Parse fully into memory once; every later by_type/index pass reuses this model
+    model = ifcopenshell.open(str(path), should_stream=False)
     schema = model.schema
-    print(f"[IFC Parser] Schema: {schema}, opened in {time.time() - t0:.1f}s")
+    logger.info(f"[IFC Parser] Schema: {schema}, opened in {time.time() - t0:.1f}s "
+                f"(IfcOpenShell {ifcopenshell.version})")
 
     # Create model record in Supabase
     model_id = str(uuid.uuid4())
@@ -340,86 +744,112 @@ def parse_ifc_file(file_path: str, model_name: str = None):
         "file_size": file_size,
         "schema_version": schema,
         "parse_status": "parsing",
-    }).execute()
+    }, returning=ReturningMethod.minimal).execute()
 
-    print(f"[IFC Parser] Model ID: {model_id}")
+    logger.info(f"[IFC Parser] Model ID: {model_id}")
 
     # Build storey map
-    print("[IFC Parser] Building storey map...")
+    logger.info("[IFC Parser] Building storey map...")
     storey_map = build_storey_map(model)
-    print(f"[IFC Parser] Mapped {len(storey_map)} elements to storeys")
+    logger.info(f"[IFC Parser] Mapped {len(storey_map)} elements to storeys")
 
     # Build spatial tree
-    print("[IFC Parser] Building spatial tree...")
+    logger.info("[IFC Parser] Building spatial tree...")
     spatial_nodes = build_spatial_tree(model)
-    print(f"[IFC Parser] Found {len(spatial_nodes)} spatial nodes")
-
-    # Insert spatial tree
-    if spatial_nodes:
-        for node in spatial_nodes:
-            node["model_id"] = model_id
-        # Batch insert
-        for i in range(0, len(spatial_nodes), 500):
-            batch = spatial_nodes[i:i + 500]
-            supabase.table("ifc_spatial_tree").insert(batch).execute()
-        print(f"[IFC Parser] Inserted {len(spatial_nodes)} spatial nodes")
-
-    # Get all physical elements (exclude spatial structure and relationships)
-    all_elements = []
-    skip_types = {"IfcProject", "IfcSite", "IfcBuilding", "IfcBuildingStorey",
-                  "IfcSpace", "IfcOwnerHistory", "IfcGeometricRepresentationContext",
-                  "IfcRelDefinesByProperties", "IfcRelAssociatesMaterial",
-                  "IfcRelContainedInSpatialStructure", "IfcRelAggregates",
-                  "IfcPropertySet", "IfcPropertySingleValue", "IfcMaterial",
-                  "IfcMaterialLayerSet", "IfcMaterialLayer", "IfcCartesianPoint",
-                  "IfcDirection", "IfcAxis2Placement3D", "IfcLocalPlacement",
-                  "IfcShapeRepresentation", "IfcProductDefinitionShape"}
-
-    for entity in model:
-        ifc_type = entity.is_a()
-        # Include only product types (elements with geometry)
-        if hasattr(entity, "GlobalId") and ifc_type not in skip_types:
-            if hasattr(entity, "Representation") or hasattr(entity, "ObjectPlacement"):
-                all_elements.append(entity)
-
-    total = len(all_elements)
-    print(f"[IFC Parser] Processing {total} elements...")
-
-    # Process elements
-    rows = []
-    for i, element in enumerate(all_elements):
-        try:
-            data = extract_element_data(element, model, storey_map)
-            data["model_id"] = model_id
-            rows.append(data)
-        except Exception as e:
-            print(f"  [WARN] Failed to process #{element.id()} ({element.is_a()}): {e}")
+    logger.info(f"[IFC Parser] Found {len(spatial_nodes)} spatial nodes")
 
-        if (i + 1) % 100 == 0 or i == total - 1:
-            pct = round((i + 1) / total * 100)
-            print(f"  [{pct}%] Processed {i + 1}/{total} elements, {len(rows)} rows ready")
+    # Get all physical elements: every IfcProduct except the spatial structure
+    all_elements = [e for e in model.by_type("IfcProduct") if e.is_a() not in SPATIAL_TYPES]
 
-        # Batch insert every 1000 rows
-        if len(rows) >= 1000:
-            supabase.table("ifc_elements").insert(rows).execute()
-            print(f"  -> Inserted batch of {len(rows)} rows")
-            rows = []
-
-    # Insert remaining rows
-    if rows:
-        supabase.table("ifc_elements").insert(rows).execute()
-        print(f"  -> Inserted final batch of {len(rows)} rows")
+    total = len(all_elements)
+    logger.info(f"[IFC Parser] Processing {total} elements with {workers} worker(s)...")
+
+    # Process elements in chunks and COPY them in batches of COPY_BATCH_SIZE rows.
+    # Batches are copied on a background thread while the next one is extracted.
+    express_ids = [element.id() for element in all_elements]
+    chunks = [express_ids[i:i + EXTRACT_CHUNK_SIZE] for i in range(0, total, EXTRACT_CHUNK_SIZE)]
+    copied = 0
+
+    def batches():
+        if pool:
+            results = map_bounded(pool, process_ids, chunks, window=workers * 2)
+        else:
+            results = map(process_ids, chunks)
+
+        processed = 0
+        lines, property_lines, rows = [], [], 0
+        for chunk, (chunk_lines, chunk_property_lines, count) in zip(chunks, results):
+            lines.append(chunk_lines)
+            property_lines.append(chunk_property_lines)
+            rows += count
+            processed += len(chunk)
+            if logger.isEnabledFor(logging.DEBUG):
+                pct = round(processed / total * 100)
+                logger.debug(f"  [{pct}%] Processed {processed}/{total} elements, {copied} rows copied")
+
+            if rows >= COPY_BATCH_SIZE:
+                yield lines, property_lines, rows
+                lines, property_lines, rows = [], [], 0
+
+        if rows:
+            yield lines, property_lines, rows
+
+    # Executors start their threads lazily, on first submit
+    background = ThreadPoolExecutor(max_workers=1)
+    # One COPY thread on the single connection; at most 2 batches queued for it
+    copier = ThreadPoolExecutor(max_workers=1)
+    pool = None
+    conn = None
+    try:
+        if workers == 1 or multiprocessing.get_start_method() == "fork":
+            init_extraction(model, model_id, storey_map)
+
+        if workers > 1:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=init_worker,
+                initargs=(str(path), model_id, storey_map),
+            )
+            # With fork, the first submit launches every worker. Do it before any
+            # other thread exists: forking a multi-threaded process can deadlock the child.
+            pool.submit(os.getpid).result()
+
+        # Insert spatial tree in a single request, in the background while elements are extracted
+        spatial_insert = None
+        if spatial_nodes:
+            for node in spatial_nodes:
+                node["model_id"] = model_id
+            spatial_insert = background.submit(
+                supabase.table("ifc_spatial_tree").insert(spatial_nodes, returning=ReturningMethod.minimal).execute
+            )
+
+        conn = psycopg2.connect(SUPABASE_DB_URL)
+        for rows in map_bounded(copier, functools.partial(copy_batch, conn), batches(), window=2):
+            copied += rows
+            logger.debug(f"  -> Copied batch of {rows} rows")
+        logger.info(f"  -> Copied {copied} rows")
+
+        if spatial_insert:
+            spatial_insert.result()
+            logger.info(f"[IFC Parser] Inserted {len(spatial_nodes)} spatial nodes")
+    finally:
+        copier.shutdown(cancel_futures=True)
+        if conn:
+            conn.close()
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        background.shutdown()
 
     # Update model status
     supabase.table("ifc_models").update({
         "parse_status": "done",
         "element_count": total,
         "parsed_at": "now()",
-    }).eq("id", model_id).execute()
+    }, returning=ReturningMethod.minimal).eq("id", model_id).execute()
 
     elapsed = time.time() - t0
-    print(f"\n[IFC Parser] Done! Parsed {total} elements in {elapsed:.1f}s")
-    print(f"[IFC Parser] Model ID: {model_id}")
+    logger.info(f"[IFC Parser] Done! Parsed {total} elements in {elapsed:.1f}s")
+    logger.info(f"[IFC Parser] Model ID: {model_id}")
     return model_id
 
 
@@ -427,15 +857,29 @@ def parse_ifc_file(file_path: str, model_name: str = None):
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python parse_ifc.py <path_to_ifc_file> [--model-name <name>]")
+        print("Usage: python parse_ifc.py <path_to_ifc_file> [--model-name <name>] [--workers <n>] [--verbose]")
         sys.exit(1)
 
+    logging.basicConfig(
+        format="%(message)s",
+        level=logging.DEBUG if "--verbose" in sys.argv else logging.INFO,
+    )
+
     ifc_path = sys.argv[1]
     model_name = None
+    workers = None
 
     if "--model-name" in sys.argv:
         idx = sys.argv.index("--model-name")
         if idx + 1 < len(sys.argv):
             model_name = sys.argv[idx + 1]
 
-    parse_ifc_file(ifc_path, model_name)
+    if "--workers" in sys.argv:
+        idx = sys.argv.index("--workers")
+        if idx + 1 < len(sys.argv):
+            workers = int(sys.argv[idx + 1])
+            if workers < 1:
+                print("--workers must be at least 1")
+                sys.exit(1)
+
+    parse_ifc_file(ifc_path, model_name, workers)
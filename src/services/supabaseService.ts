@@ -67,7 +67,7 @@ export async function getElementIndex(modelId: string): Promise<ElementIndexEntr
 
   const { data, error } = await supabase
     .from('ifc_elements')
-    .select('express_id, ifc_type, name, floor_name, volume, area, height, length, materials, property_sets')
+    .select('express_id, ifc_type, name, floor_name, volume, area, height, length, materials, property_sets, quantity_sets')
     .eq('model_id', modelId);
   if (error) throw error;
 
@@ -81,7 +81,7 @@ export async function getElementIndex(modelId: string): Promise<ElementIndexEntr
     height: e.height || 0,
     length: e.length || 0,
     material: Array.isArray(e.materials) && e.materials.length > 0 ? e.materials[0] : '',
-    searchableProps: flattenProps(e.property_sets),
+    searchableProps: [...flattenProps(e.property_sets), ...flattenProps(e.quantity_sets)],
   }));
   setCache(cacheKey, result);
   return result;
@@ -0,0 +1,12 @@
+-- One narrow row per property / quantity value (bulk-loaded via COPY alongside ifc_elements)
+CREATE TABLE IF NOT EXISTS ifc_element_properties (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    model_id UUID NOT NULL REFERENCES ifc_models(id) ON DELETE CASCADE,
+    express_id INTEGER NOT NULL,
+    pset_name TEXT NOT NULL,           -- Pset_WallCommon, Qto_WallBaseQuantities, ...
+    key TEXT NOT NULL,
+    value_text TEXT,
+    value_num DOUBLE PRECISION         -- set for numeric values only
+);
+CREATE INDEX IF NOT EXISTS idx_element_props_key ON ifc_element_properties(model_id, pset_name, key);
+CREATE INDEX IF NOT EXISTS idx_element_props_element ON ifc_element_properties(model_id, express_id);